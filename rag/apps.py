@@ -1,6 +1,35 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Program names that run Django management commands rather than serve requests
+MANAGEMENT_PROGRAMS = ('manage', 'django-admin')
+
+
+def serves_requests():
+    """Tell whether this process serves requests rather than running a command or tests"""
+    if 'runserver' in sys.argv[1:]:
+        # The autoreloader's parent process only watches files
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+    program = sys.argv[0] if sys.argv else ''
+    name = os.path.basename(program)
+    if os.path.splitext(name)[0] in MANAGEMENT_PROGRAMS:
+        return False
+    # `python -m django` runs django/__main__.py
+    if name == '__main__.py' and os.path.basename(os.path.dirname(program)) == 'django':
+        return False
+    return 'pytest' not in sys.modules
 
 class RagConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rag'
+
+    def ready(self):
+        # Only warm up in processes that serve requests
+        if not serves_requests():
+            return
+
+        from .views import start_rag_warmup
+        start_rag_warmup()
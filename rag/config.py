@@ -0,0 +1,49 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+def _quote_dsn_value(value):
+    """Quote a value for a libpq key=value connection string"""
+    escaped = str(value).replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{escaped}'"
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Application settings read once from the environment"""
+    deepseek_api_key: Optional[str]
+    db_host: str
+    db_name: str
+    db_user: str
+    db_password: str
+    db_port: str
+    # Precomputed so psycopg2.connect doesn't rebuild it from kwargs
+    database_dsn: str
+    embedding_onnx_path: str
+
+@lru_cache(maxsize=None)
+def get_config():
+    """Load settings from .env and the environment once per process"""
+    load_dotenv()
+
+    database = {
+        'dbname': os.getenv('DB_NAME', 'ecommerce_db'),
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'your_username'),
+        'password': os.getenv('DB_PASSWORD', 'your_password'),
+        'port': os.getenv('DB_PORT', '5432')
+    }
+
+    return Config(
+        deepseek_api_key=os.getenv('DEEPSEEK_API_KEY'),
+        db_host=database['host'],
+        db_name=database['dbname'],
+        db_user=database['user'],
+        db_password=database['password'],
+        db_port=database['port'],
+        database_dsn=' '.join(f"{key}={_quote_dsn_value(value)}" for key, value in database.items()),
+        embedding_onnx_path=os.getenv('EMBEDDING_ONNX_PATH', 'rag/onnx_model_int8')
+    )
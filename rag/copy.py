@@ -1,40 +1,132 @@
+import atexit
 import os
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.shortcuts import render
 from django.http import HttpResponse
-import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
 from typing import List
 
 # LangChain imports
 from langchain_community.document_loaders import DataFrameLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.schema import Document
 
-# Load environment variables
-load_dotenv()
-os.environ["DEEPSEEK_API_KEY"] = os.getenv("DEEPSEEK_API_KEY")
+from .config import get_config
+from .documents import build_documents, compile_template
+from .embeddings import get_embeddings, prune_embeddings_cache
+from .llm_cache import configure_llm_cache
+from .state import RagState
+from .vector_index import (
+    INDEX_FILE_NAME,
+    build_vector_store,
+    load_vector_store_local,
+    save_vector_store_local
+)
 
-# Database configuration
-DATABASE_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'database': os.getenv('DB_NAME', 'ecommerce_db'),
-    'user': os.getenv('DB_USER', 'your_username'),
-    'password': os.getenv('DB_PASSWORD', 'your_password'),
-    'port': os.getenv('DB_PORT', '5432')
+# Vector store persisted between process starts
+VECTOR_STORE_PATH = 'rag/faiss_store'
+
+# Page content templates per table, compiled once at import
+CONTENT_TEMPLATES = {
+    'products': (
+        "Product: {name}\n"
+        "Description: {description}\n"
+        "Price: ${price}\n"
+        "Category: {category}\n"
+        "Brand: {brand}\n"
+        "Rating: {rating}/5\n"
+        "Stock: {stock_quantity} units"
+    ),
+    'categories': (
+        "Category: {name}\n"
+        "Description: {description}\n"
+        "Parent Category: {parent_category}"
+    ),
+    'reviews': (
+        "Product Review for: {product_name}\n"
+        "Rating: {rating}/5\n"
+        "Review: {review_text}\n"
+        "Date: {created_at}"
+    ),
+    'orders': (
+        "Order Information:\n"
+        "Product: {product_name}\n"
+        "Quantity: {quantity}\n"
+        "Price: ${price}\n"
+        "Order Status: {status}\n"
+        "Order Date: {created_at}"
+    )
+}
+CONTENT_FORMATTERS = {
+    table_name: compile_template(template)
+    for table_name, template in CONTENT_TEMPLATES.items()
 }
 
+# Postgres connections shared across reloads, created on first use
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 8
+
+# Rows fetched per round trip from server-side cursors
+FETCH_BATCH_SIZE = 5000
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+def get_connection_pool():
+    """Return the shared Postgres connection pool, creating it on first use"""
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ThreadedConnectionPool(
+                POOL_MIN_CONNECTIONS,
+                POOL_MAX_CONNECTIONS,
+                get_config().database_dsn
+            )
+            # Django has no shutdown signal, so close the pool at interpreter exit
+            atexit.register(close_connection_pool)
+        return _connection_pool
+
+def close_connection_pool():
+    """Close every pooled Postgres connection"""
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is not None:
+            _connection_pool.closeall()
+            _connection_pool = None
+
+def load_table_documents(pool, table_name, query):
+    """Stream a table through a server-side cursor, building documents batch by batch"""
+    conn = pool.getconn()
+    try:
+        # Named cursors need a transaction; a read-only one skips write bookkeeping
+        if not conn.readonly:
+            conn.set_session(readonly=True, autocommit=False)
+        
+        documents = []
+        with conn.cursor(name=f"c_{table_name}", withhold=False) as cur:
+            cur.itersize = FETCH_BATCH_SIZE
+            cur.execute(query)
+            
+            # Only one batch is held in memory at a time
+            for rows in iter(lambda: cur.fetchmany(FETCH_BATCH_SIZE), []):
+                batch = pd.DataFrame.from_records(rows, columns=[col.name for col in cur.description])
+                contents = CONTENT_FORMATTERS[table_name](batch)
+                # Create documents with the full row as metadata
+                documents.extend(build_documents(table_name, contents, batch))
+        
+        # End the read-only transaction before returning the connection
+        conn.rollback()
+        return documents
+    finally:
+        # Drop connections the server closed instead of handing them out again
+        pool.putconn(conn, close=bool(conn.closed))
+
 def load_ecommerce_data():
     """Load data from PostgreSQL database and convert to documents"""
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        
         # Define your queries for different ecommerce tables
         queries = {
             'products': """
@@ -95,85 +187,64 @@ def load_ecommerce_data():
             """
         }
         
+        # Each query waits on Postgres independently, so run them concurrently
+        pool = get_connection_pool()
         all_documents = []
         
-        for table_name, query in queries.items():
-            df = pd.read_sql_query(query, conn)
-            
-            # Convert each row to a document
-            for _, row in df.iterrows():
-                if table_name == 'products':
-                    content = f"""
-                    Product: {row['name']}
-                    Description: {row['description']}
-                    Price: ${row['price']}
-                    Category: {row['category']}
-                    Brand: {row['brand']}
-                    Rating: {row['rating']}/5
-                    Stock: {row['stock_quantity']} units
-                    """
-                    
-                elif table_name == 'categories':
-                    content = f"""
-                    Category: {row['name']}
-                    Description: {row['description']}
-                    Parent Category: {row['parent_category']}
-                    """
-                    
-                elif table_name == 'reviews':
-                    content = f"""
-                    Product Review for: {row['product_name']}
-                    Rating: {row['rating']}/5
-                    Review: {row['review_text']}
-                    Date: {row['created_at']}
-                    """
-                    
-                elif table_name == 'orders':
-                    content = f"""
-                    Order Information:
-                    Product: {row['product_name']}
-                    Quantity: {row['quantity']}
-                    Price: ${row['price']}
-                    Order Status: {row['status']}
-                    Order Date: {row['created_at']}
-                    """
-                
-                # Create document with metadata
-                doc = Document(
-                    page_content=content,
-                    metadata={
-                        'source': table_name,
-                        'id': row['id'],
-                        **{k: v for k, v in row.items() if k != 'id'}
-                    }
-                )
-                all_documents.append(doc)
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            table_documents = executor.map(
+                lambda item: load_table_documents(pool, *item),
+                queries.items()
+            )
+            for documents in table_documents:
+                all_documents.extend(documents)
         
-        conn.close()
         return all_documents
         
     except Exception as e:
         print(f"Error loading data from database: {e}")
         return []
 
-def setup_rag_chain():
-    """Set up RAG system with PostgreSQL data"""
+def load_saved_vector_store():
+    """Load the vector store saved by the last database load, if any"""
     try:
-        # Load documents from database
-        docs = load_ecommerce_data()
-        
-        if not docs:
-            print("No documents loaded from database")
+        if not os.path.exists(os.path.join(VECTOR_STORE_PATH, INDEX_FILE_NAME)):
             return None
+        return load_vector_store_local(VECTOR_STORE_PATH, get_embeddings())
+    except Exception as e:
+        print(f"Error loading saved vector store: {e}")
+        return None
+
+def setup_rag_chain(use_saved_store=False):
+    """Set up RAG system with PostgreSQL data, returning the chain and its vector store"""
+    try:
+        vector_store = load_saved_vector_store() if use_saved_store else None
         
-        print(f"Loaded {len(docs)} documents from database")
-        
-        # Create embeddings and vector store
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        vector_store = FAISS.from_documents(docs, embeddings)
+        if vector_store is None:
+            # Load documents from database
+            docs = load_ecommerce_data()
+            
+            if not docs:
+                print("No documents loaded from database")
+                return None, None
+            
+            print(f"Loaded {len(docs)} documents from database")
+            
+            # Create vector store with the shared embeddings model
+            vector_store = build_vector_store(docs, get_embeddings())
+            
+            # Save so the next process start can skip the database load
+            os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
+            save_vector_store_local(vector_store, VECTOR_STORE_PATH)
+            
+            # Vectors of rows that changed or were deleted are never read again
+            prune_embeddings_cache(len(docs))
+        else:
+            print("Using saved vector store from disk")
         
-        # Set up the DeepSeek model
-        llm = ChatDeepSeek(model="deepseek-chat", temperature=0)
+        # Set up the DeepSeek model behind the shared LLM cache
+        configure_llm_cache()
+        llm = ChatDeepSeek(model="deepseek-chat", temperature=0, api_key=get_config().deepseek_api_key)
         
         # Enhanced prompt template for ecommerce
         prompt_template = ChatPromptTemplate.from_messages([
@@ -198,35 +269,31 @@ def setup_rag_chain():
         retriever = vector_store.as_retriever(search_kwargs={"k": 5})
         retrieval_chain = create_retrieval_chain(retriever, document_chain)
         
-        return retrieval_chain
+        return retrieval_chain, vector_store
         
     except Exception as e:
         print(f"Error setting up RAG chain: {e}")
-        return None
+        return None, None
 
-# Global variable to store the RAG chain
-rag_chain = None
+# Shared RAG chain and vector store, swapped atomically on refresh
+rag_state = RagState()
 
 def initialize_rag():
     """Initialize RAG chain (call this when Django starts)"""
-    global rag_chain
-    rag_chain = setup_rag_chain()
+    return rag_state.initialize(lambda: setup_rag_chain(use_saved_store=True))
 
 def refresh_rag_data():
     """Refresh RAG system with latest database data"""
-    global rag_chain
-    rag_chain = setup_rag_chain()
-    return rag_chain is not None
+    # Requests keep using the current chain until the new one is swapped in
+    return rag_state.refresh(setup_rag_chain)
 
 def rag_view(request):
     """Main view for RAG application"""
-    global rag_chain
-    
     response = None
     error = None
     
     # Initialize RAG chain if not already done
-    if rag_chain is None:
+    if rag_state.chain is None:
         initialize_rag()
     
     if request.method == 'POST':
@@ -241,6 +308,7 @@ def rag_view(request):
         
         elif action == 'query':
             query = request.POST.get('query', '')
+            rag_chain = rag_state.chain
             if query and rag_chain:
                 try:
                     result = rag_chain.invoke({"input": query})
@@ -270,6 +338,7 @@ def rag_view(request):
 
 def get_product_recommendations(user_query: str, limit: int = 5):
     """Get product recommendations based on user query"""
+    rag_chain = rag_state.chain
     if not rag_chain:
         return []
     
@@ -283,6 +352,7 @@ def get_product_recommendations(user_query: str, limit: int = 5):
 
 def search_products_by_category(category: str):
     """Search for products in a specific category"""
+    rag_chain = rag_state.chain
     if not rag_chain:
         return "RAG system not initialized"
     
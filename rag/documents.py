@@ -0,0 +1,43 @@
+from string import Formatter
+from typing import List
+
+import pandas as pd
+
+# LangChain imports
+from langchain.schema import Document
+
+
+def compile_template(template: str):
+    """Compile a str.format template into a function that formats a whole DataFrame at once"""
+    # Split into literal text and column names once, not per row
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if literal:
+            parts.append((literal, None))
+        if field is not None:
+            # Columns are formatted with str() only
+            if spec or conversion:
+                raise ValueError(f"Format specs and conversions are not supported: {{{field}}}")
+            parts.append((None, field))
+
+    def format_frame(df: pd.DataFrame) -> pd.Series:
+        contents = pd.Series('', index=df.index, dtype=object)
+        for literal, field in parts:
+            if field is None:
+                contents = contents + literal
+            else:
+                # Missing values (SQL NULL, including NaT) render as empty text
+                column = df[field]
+                contents = contents + column.astype(object).where(column.notna(), '').astype(str)
+        return contents
+
+    return format_frame
+
+def build_documents(source: str, contents: pd.Series, metadata: pd.DataFrame) -> List[Document]:
+    """Zip vectorized page contents with per-row metadata records into documents"""
+    metadatas = [{'source': source, **meta} for meta in metadata.to_dict(orient='records')]
+    # Inputs are generated internally, so skip pydantic validation per document
+    return [
+        Document.model_construct(page_content=content, metadata=meta)
+        for content, meta in zip(contents.tolist(), metadatas)
+    ]
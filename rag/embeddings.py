@@ -0,0 +1,203 @@
+import asyncio
+import os
+import weakref
+from functools import lru_cache
+
+import numpy as np
+import torch
+
+# LangChain imports
+from langchain_core.embeddings import Embeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from .config import get_config
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 128
+EMBEDDINGS_CACHE_PATH = 'rag/embed_cache'
+# Cached vectors kept on disk; the least recently used beyond this are pruned
+EMBEDDINGS_CACHE_MAX_ENTRIES = 20000
+
+# int8-quantized ONNX export of the encoder, used instead of PyTorch when present
+ONNX_MODEL_FILE = 'model_quantized.onnx'
+ONNX_BATCH_SIZE = 64
+ONNX_MAX_LENGTH = 256
+
+# Window in seconds for coalescing concurrent async query embeddings
+QUERY_BATCH_WINDOW = 0.05
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an int8-quantized ONNX Runtime export of the encoder"""
+
+    def __init__(self, model_path, batch_size=ONNX_BATCH_SIZE):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_path, file_name=ONNX_MODEL_FILE)
+        self.tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_LENGTH,
+                return_tensors='np'
+            )
+            token_embeddings = self.model(**inputs).last_hidden_state
+
+            # Mean pooling over real tokens, then L2 normalization, as sentence-transformers does
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+@lru_cache(maxsize=None)
+def get_base_embeddings():
+    """Load the sentence-transformer encoder once per process"""
+    onnx_model_path = get_config().embedding_onnx_path
+    if os.path.isdir(onnx_model_path):
+        try:
+            return OnnxEmbeddings(onnx_model_path)
+        except Exception as e:
+            print(f"Error loading ONNX encoder, using PyTorch model: {e}")
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={"device": device},
+        encode_kwargs={
+            "batch_size": EMBEDDING_BATCH_SIZE,
+            "normalize_embeddings": True,
+            "convert_to_numpy": True
+        }
+    )
+
+    # fp16 halves memory traffic on GPU; CPU kernels stay in fp32
+    if device == "cuda":
+        embeddings.client.half()
+
+    return embeddings
+
+class _QueryBatch:
+    """Async query embeddings waiting to be encoded on one event loop"""
+
+    def __init__(self):
+        self.pending = []
+        self.flush_task = None
+        self.semaphore = asyncio.Semaphore(1)
+
+class MicroBatchingEmbeddings(Embeddings):
+    """Embeddings that coalesce concurrent async queries into one encoder batch"""
+
+    def __init__(self, document_embeddings, query_embeddings, batch_window=QUERY_BATCH_WINDOW):
+        self.document_embeddings = document_embeddings
+        self.query_embeddings = query_embeddings
+        self.batch_window = batch_window
+        # asyncio primitives are bound to a loop, so keep one batch per loop
+        self._batches = weakref.WeakKeyDictionary()
+
+    def embed_documents(self, texts):
+        return self.document_embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.query_embeddings.embed_query(text)
+
+    def embed_queries(self, texts):
+        """Embed many queries in one encoder call, bypassing the document cache"""
+        return self.query_embeddings.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(loop)
+        if batch is None:
+            batch = self._batches[loop] = _QueryBatch()
+
+        future = loop.create_future()
+        batch.pending.append((text, future))
+        if batch.flush_task is None:
+            batch.flush_task = loop.create_task(self._flush(batch))
+        return await future
+
+    async def _flush(self, batch):
+        """Encode every query that arrived within the batch window in one call"""
+        await asyncio.sleep(self.batch_window)
+        pending, batch.pending, batch.flush_task = batch.pending, [], None
+
+        try:
+            # Only one encoder call at a time keeps the GPU fed with full batches
+            async with batch.semaphore:
+                vectors = await asyncio.to_thread(
+                    self.query_embeddings.embed_documents,
+                    [text for text, _ in pending]
+                )
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(pending, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+def get_encoder_name():
+    """Name the encoder in use; vectors from different encoders must never be mixed"""
+    if isinstance(get_base_embeddings(), OnnxEmbeddings):
+        return EMBEDDING_MODEL_NAME + '-onnx-int8'
+    return EMBEDDING_MODEL_NAME
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """Shared embeddings: cached document vectors and micro-batched async queries"""
+    base_embeddings = get_base_embeddings()
+    # Vectors from different encoders must not share cache entries
+    namespace = get_encoder_name()
+
+    # Reads refresh each entry's access time so pruning keeps the vectors still in use
+    store = LocalFileStore(EMBEDDINGS_CACHE_PATH, update_atime=True)
+    # Only documents missing from the store are sent through the encoder
+    document_embeddings = CacheBackedEmbeddings.from_bytes_store(
+        base_embeddings,
+        store,
+        namespace=namespace,
+        key_encoder="sha256"
+    )
+    return MicroBatchingEmbeddings(document_embeddings, base_embeddings)
+
+def prune_embeddings_cache(in_use=0):
+    """Delete the least recently used cached vectors beyond the size cap, keeping the in-use ones"""
+    # Vectors of the documents just indexed are the most recently used, so never prune those
+    max_entries = max(EMBEDDINGS_CACHE_MAX_ENTRIES, in_use)
+    entries = []
+    for root, _, files in os.walk(EMBEDDINGS_CACHE_PATH):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                entries.append((os.stat(path).st_atime, path))
+            except OSError:
+                pass
+
+    if len(entries) <= max_entries:
+        return 0
+
+    entries.sort()
+    removed = 0
+    for _, path in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,67 @@
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+# LangChain imports
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
+
+# Cosine distance under which two queries count as near-duplicates
+SEMANTIC_CACHE_MAX_DISTANCE = 0.2
+SEMANTIC_CACHE_SIZE = 512
+LLM_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=None)
+def configure_llm_cache():
+    """Install the process-wide exact-match LLM cache, keyed by the full rendered prompt"""
+    set_llm_cache(InMemoryCache(maxsize=LLM_CACHE_SIZE))
+
+class SemanticAnswerCache:
+    """Answers keyed by query embedding, so near-duplicate questions reuse a cached answer"""
+
+    def __init__(self, max_distance=SEMANTIC_CACHE_MAX_DISTANCE, maxsize=SEMANTIC_CACHE_SIZE):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._generations = None
+        self._answers = []
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, query_vector, generation=0):
+        """Return the answer of the closest cached query of a generation within the distance threshold"""
+        query_vector = self._normalize(query_vector)
+        with self._lock:
+            if not self._answers:
+                return None
+            # Vectors are normalized, so cosine distance is one minus the inner product
+            scores = np.where(self._generations == generation, self._vectors @ query_vector, -np.inf)
+            best = int(np.argmax(scores))
+            if 1.0 - scores[best] <= self.max_distance:
+                return self._answers[best]
+            return None
+
+    def update(self, query_vector, answer, generation=0):
+        """Cache an answer under its query embedding, dropping the oldest beyond the cache size"""
+        query_vector = self._normalize(query_vector)[None, :]
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = query_vector
+                self._generations = np.array([generation])
+            else:
+                self._vectors = np.vstack([self._vectors, query_vector])[-self.maxsize:]
+                self._generations = np.append(self._generations, generation)[-self.maxsize:]
+            self._answers = (self._answers + [answer])[-self.maxsize:]
+
+    def clear(self):
+        """Drop all cached answers"""
+        with self._lock:
+            self._vectors = None
+            self._generations = None
+            self._answers = []
@@ -0,0 +1,80 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; builds are then only serialized per process
+    fcntl = None
+
+# Lock file that lets a single process build the index while others wait
+BUILD_LOCK_PATH = 'rag/.build.lock'
+
+
+@contextmanager
+def process_build_lock(path=BUILD_LOCK_PATH):
+    """Hold an exclusive file lock so only one process builds the index at a time"""
+    if fcntl is None:
+        yield
+        return
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class RagState:
+    """RAG chain and vector store shared by every request thread"""
+
+    def __init__(self):
+        # Builds are serialized; readers never take the lock
+        self._build_lock = threading.RLock()
+        # Set once the first initialization attempt has finished, successful or not
+        self.ready = threading.Event()
+        # Chain, store and a build counter are published together as one reference
+        self._current = (None, None, 0)
+
+    @property
+    def chain(self):
+        return self._current[0]
+
+    @property
+    def vector_store(self):
+        return self._current[1]
+
+    @property
+    def generation(self):
+        return self._current[2]
+
+    def snapshot(self):
+        """Return the chain, vector store and generation that were published together"""
+        return self._current
+
+    def _publish(self, chain, vector_store):
+        self._current = (chain, vector_store, self.generation + 1)
+
+    def initialize(self, build):
+        """Build the chain once; concurrent callers wait for the first build instead of repeating it"""
+        try:
+            with self._build_lock:
+                if self.chain is None:
+                    with process_build_lock():
+                        chain, vector_store = build()
+                    if chain is not None:
+                        self._publish(chain, vector_store)
+        finally:
+            self.ready.set()
+        return self.chain is not None
+
+    def refresh(self, build):
+        """Build a new chain off to the side, then swap it in; keep the old one if the build fails"""
+        with self._build_lock:
+            with process_build_lock():
+                chain, vector_store = build()
+            if chain is None:
+                return False
+            self._publish(chain, vector_store)
+            return True
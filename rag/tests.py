@@ -1,3 +1,164 @@
+import threading
+import time
+from unittest import mock
+
+import orjson
+import pandas as pd
 from django.test import TestCase
 
-# Create your tests here.
+from . import views
+from .documents import compile_template
+from .llm_cache import SemanticAnswerCache
+from .state import RagState
+
+
+class CompileTemplateTests(TestCase):
+    def test_formats_every_row(self):
+        format_frame = compile_template("Product: {name}\nPrice: ${price}")
+        df = pd.DataFrame({'name': ['Lamp', 'Desk'], 'price': [19.99, 250]})
+
+        self.assertEqual(
+            format_frame(df).tolist(),
+            ["Product: Lamp\nPrice: $19.99", "Product: Desk\nPrice: $250.0"]
+        )
+
+    def test_missing_values_render_as_empty_text(self):
+        format_frame = compile_template("Name: {name} Rating: {rating} Date: {created_at}")
+        df = pd.DataFrame({
+            'name': ['Lamp', None],
+            'rating': [4.5, float('nan')],
+            'created_at': pd.to_datetime(['2024-05-01 12:30:00', None]),
+        })
+
+        self.assertEqual(
+            format_frame(df).tolist(),
+            ["Name: Lamp Rating: 4.5 Date: 2024-05-01 12:30:00", "Name:  Rating:  Date: "]
+        )
+
+    def test_literal_only_template(self):
+        format_frame = compile_template("Order Information:")
+        df = pd.DataFrame({'id': [1, 2]})
+
+        self.assertEqual(format_frame(df).tolist(), ["Order Information:", "Order Information:"])
+
+    def test_rejects_format_spec(self):
+        with self.assertRaises(ValueError):
+            compile_template("Price: ${price:.2f}")
+
+    def test_rejects_conversion(self):
+        with self.assertRaises(ValueError):
+            compile_template("Name: {name!r}")
+
+class RagStateTests(TestCase):
+    def test_initialize_builds_once_under_concurrent_callers(self):
+        state = RagState()
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'chain', 'store'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(state.initialize(build)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual((state.chain, state.vector_store), ('chain', 'store'))
+        self.assertTrue(state.ready.is_set())
+
+    def test_failed_initialize_still_sets_ready(self):
+        state = RagState()
+
+        self.assertFalse(state.initialize(lambda: (None, None)))
+        self.assertIsNone(state.chain)
+        self.assertTrue(state.ready.is_set())
+
+    def test_refresh_swaps_in_new_chain(self):
+        state = RagState()
+        state.initialize(lambda: ('old chain', 'old store'))
+
+        self.assertTrue(state.refresh(lambda: ('new chain', 'new store')))
+        self.assertEqual(state.snapshot(), ('new chain', 'new store', 2))
+
+    def test_refresh_keeps_old_chain_when_build_fails(self):
+        state = RagState()
+        state.initialize(lambda: ('old chain', 'old store'))
+
+        self.assertFalse(state.refresh(lambda: (None, None)))
+        self.assertEqual(state.snapshot(), ('old chain', 'old store', 1))
+
+    def test_refresh_keeps_old_chain_when_build_raises(self):
+        state = RagState()
+        state.initialize(lambda: ('old chain', 'old store'))
+
+        def build():
+            raise RuntimeError("index build failed")
+
+        with self.assertRaises(RuntimeError):
+            state.refresh(build)
+        self.assertEqual(state.snapshot(), ('old chain', 'old store', 1))
+
+class SemanticAnswerCacheTests(TestCase):
+    def test_near_duplicate_query_hits(self):
+        cache = SemanticAnswerCache(max_distance=0.2)
+        cache.update([1.0, 0.0], 'answer', generation=1)
+
+        self.assertEqual(cache.lookup([1.0, 0.1], generation=1), 'answer')
+        self.assertIsNone(cache.lookup([0.0, 1.0], generation=1))
+
+    def test_answers_from_other_generations_are_not_served(self):
+        cache = SemanticAnswerCache(max_distance=0.2)
+        cache.update([1.0, 0.0], 'stale answer', generation=1)
+
+        self.assertIsNone(cache.lookup([1.0, 0.0], generation=2))
+
+class BatchQueryViewTests(TestCase):
+    def post(self, payload):
+        body = payload if isinstance(payload, bytes) else orjson.dumps(payload)
+        return self.client.post('/rag/batch/', data=body, content_type='application/json')
+
+    def test_rejects_malformed_bodies(self):
+        for body in (b'not json', b'[]', b'{}'):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+
+    def test_rejects_queries_that_are_not_a_list_of_strings(self):
+        for queries in ("yoga mat", ["yoga mat", 3], {"q": "yoga mat"}, None):
+            with self.subTest(queries=queries):
+                self.assertEqual(self.post({'queries': queries, 'k': 3}).status_code, 400)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        for queries in ([], ["", "   "], ["lamp"] * (views.MAX_BATCH_QUERIES + 1)):
+            with self.subTest(count=len(queries)):
+                self.assertEqual(self.post({'queries': queries}).status_code, 400)
+
+    def test_rejects_k_out_of_range(self):
+        for k in (0, views.MAX_BATCH_K + 1, "many"):
+            with self.subTest(k=k):
+                self.assertEqual(self.post({'queries': ["lamp"], 'k': k}).status_code, 400)
+
+    def test_rejects_get(self):
+        self.assertEqual(self.client.get('/rag/batch/').status_code, 405)
+
+    def test_searches_stripped_non_empty_queries(self):
+        state = RagState()
+        state.initialize(lambda: ('chain', 'store'))
+
+        with mock.patch.object(views, 'rag_state', state), \
+                mock.patch.object(views, 'batch_query', return_value=[[], []]) as batch_query:
+            response = self.post({'queries': ["  yoga mat ", "", "   ", "lamp"], 'k': 3})
+
+        self.assertEqual(response.status_code, 200)
+        batch_query.assert_called_once_with(["yoga mat", "lamp"], 3)
+        self.assertEqual(
+            response.json(),
+            {'results': [{'query': "yoga mat", 'documents': []}, {'query': "lamp", 'documents': []}]}
+        )
@@ -5,4 +5,6 @@ from . import views
 urlpatterns = [
     path('', views.rag_view, name='rag_view'),
     path('index/', views.rag_view, name='index'),
+    path('stream/', views.rag_stream_view, name='rag_stream'),
+    path('batch/', views.batch_query_view, name='rag_batch'),
 ]
\ No newline at end of file
@@ -0,0 +1,238 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import List
+
+import faiss
+import numpy as np
+
+# LangChain imports
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain.schema import Document
+
+from .embeddings import get_encoder_name
+
+# HNSW graph parameters for the CPU index
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# 4-bit PQ FastScan parameters for corpora too large to hold as fp32
+FASTSCAN_MIN_VECTORS = 50000
+FASTSCAN_FACTORY = "IVF256,PQ48x4fsr"
+FASTSCAN_NPROBE = 16
+# Trained per encoder, since each one places vectors differently
+FASTSCAN_TRAINED_PATH = 'rag/fastscan_trained_{encoder}.faiss'
+
+# File names used by LangChain's FAISS.save_local
+INDEX_FILE_NAME = 'index.faiss'
+DOCSTORE_FILE_NAME = 'index.pkl'
+# Records which encoder produced a saved index's vectors
+ENCODER_FILE_NAME = 'encoder.txt'
+
+# Map saved index data instead of copying it into each process
+INDEX_MMAP_FLAGS = (
+    faiss.IO_FLAG_MMAP
+    | faiss.IO_FLAG_READ_ONLY
+    | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+)
+
+
+# FAISS GPU indexes and their StandardGpuResources are not safe to search from
+# several threads at once, so every search on a GPU index goes through a lock
+def serialize_gpu_search(index):
+    """Route every search on a GPU index through a per-index lock"""
+    lock = threading.Lock()
+    search = index.search
+
+    def locked_search(*args, **kwargs):
+        with lock:
+            return search(*args, **kwargs)
+
+    index.search = locked_search
+    return index
+
+def gpu_available():
+    """Check whether FAISS was built with cuVS support and a GPU is visible"""
+    return hasattr(faiss, 'GpuIndexCagra') and faiss.get_num_gpus() > 0
+
+def index_cpu_to_gpu(index):
+    """Copy a CPU index onto the first GPU, with searches serialized"""
+    res = faiss.StandardGpuResources()
+    gpu_index = faiss.index_cpu_to_gpu(res, 0, index)
+    # Keep the GPU resources alive for as long as the index is
+    gpu_index.referenced_objects = [res]
+    return serialize_gpu_search(gpu_index)
+
+def load_trained_fastscan_index(xb):
+    """Load the persisted trained FastScan quantizer, training and saving it if missing"""
+    dim = xb.shape[1]
+    trained_path = FASTSCAN_TRAINED_PATH.format(encoder=get_encoder_name().replace('/', '_'))
+
+    if os.path.exists(trained_path):
+        index = faiss.read_index(trained_path)
+        if index.d == dim and index.is_trained:
+            return index
+
+    # Embeddings are deterministic, so the quantizer only needs training once
+    index = faiss.index_factory(dim, FASTSCAN_FACTORY, faiss.METRIC_INNER_PRODUCT)
+    index.train(xb)
+    faiss.write_index(index, trained_path)
+    return index
+
+def build_fastscan_index(xb):
+    """Build an IVF index with 4-bit PQ FastScan codes"""
+    # Let the SIMD FastScan kernels use every core
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+
+    index = load_trained_fastscan_index(xb)
+    index.add(xb)
+    index.nprobe = FASTSCAN_NPROBE
+    return index
+
+def build_index(xb):
+    """Build an inner-product index over normalized vectors, on GPU via CAGRA when possible"""
+    dim = xb.shape[1]
+
+    if gpu_available():
+        res = faiss.StandardGpuResources()
+        cfg = faiss.GpuIndexCagraConfig()
+        index = faiss.GpuIndexCagra(res, dim, faiss.METRIC_INNER_PRODUCT, cfg)
+        # CAGRA builds its search graph from the full dataset in train()
+        index.train(xb)
+        # Keep the GPU resources alive for as long as the index is
+        index.referenced_objects = [res]
+        return serialize_gpu_search(index)
+
+    if len(xb) >= FASTSCAN_MIN_VECTORS:
+        return build_fastscan_index(xb)
+
+    # HNSW keeps per-query work logarithmic in the corpus size
+    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.add(xb)
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+def build_vector_store(docs: List[Document], embeddings):
+    """Embed documents and wrap a raw FAISS index into a LangChain vector store"""
+    xb = np.asarray(
+        embeddings.embed_documents([doc.page_content for doc in docs]),
+        dtype=np.float32
+    )
+    # Normalized vectors make inner product equivalent to cosine similarity
+    faiss.normalize_L2(xb)
+
+    index = build_index(xb)
+
+    ids = [str(uuid.uuid4()) for _ in docs]
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids)),
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
+
+def _write_vector_store(vector_store, path):
+    """Write the index, docstore and encoder name of a vector store into a directory"""
+    index = vector_store.index
+    if gpu_available() and isinstance(index, faiss.GpuIndex):
+        vector_store.index = faiss.index_gpu_to_cpu(index)
+        try:
+            vector_store.save_local(path)
+        finally:
+            vector_store.index = index
+    else:
+        vector_store.save_local(path)
+
+    with open(os.path.join(path, ENCODER_FILE_NAME), 'w') as f:
+        f.write(get_encoder_name())
+
+def save_vector_store_local(vector_store, path):
+    """Save a vector store to disk, replacing any previous store at the path atomically"""
+    path = os.path.normpath(path)
+    parent = os.path.dirname(path) or '.'
+    name = os.path.basename(path)
+
+    # Running workers may have the current index memory-mapped, and FAISS truncates
+    # files it writes, so write the new store beside it and swap the directory in
+    new_path = tempfile.mkdtemp(prefix=f'.{name}.new.', dir=parent)
+    try:
+        _write_vector_store(vector_store, new_path)
+        if os.path.isdir(path):
+            # Renaming keeps the old files alive for whoever still maps them
+            old_path = tempfile.mkdtemp(prefix=f'.{name}.old.', dir=parent)
+            os.replace(path, old_path)
+            try:
+                os.replace(new_path, path)
+            except OSError:
+                os.replace(old_path, path)
+                raise
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.replace(new_path, path)
+    except Exception:
+        shutil.rmtree(new_path, ignore_errors=True)
+        raise
+
+def load_vector_store_local(path, embeddings):
+    """Load a saved vector store, memory-mapping CPU indexes so workers share the page cache"""
+    # Vectors from another encoder are not comparable with today's queries; callers rebuild instead
+    encoder_path = os.path.join(path, ENCODER_FILE_NAME)
+    saved_encoder = None
+    if os.path.exists(encoder_path):
+        with open(encoder_path) as f:
+            saved_encoder = f.read().strip()
+    if saved_encoder != get_encoder_name():
+        raise ValueError(f"Saved index was built with encoder {saved_encoder}, not {get_encoder_name()}")
+
+    index_path = os.path.join(path, INDEX_FILE_NAME)
+    # Mapping is safe because save_vector_store_local never rewrites a saved index in place
+    try:
+        index = faiss.read_index(index_path, INDEX_MMAP_FLAGS)
+    except RuntimeError:
+        # Not every index type supports mmap; read it into memory instead
+        index = faiss.read_index(index_path)
+
+    # A CAGRA graph was saved as its CPU form; search it on the GPU again when one is present
+    if gpu_available() and isinstance(index, faiss.IndexHNSWCagra):
+        try:
+            index = index_cpu_to_gpu(index)
+        except RuntimeError as e:
+            print(f"Error moving saved index to GPU, searching on CPU: {e}")
+
+    # The docstore pickle is written by this app, never taken from users
+    with open(os.path.join(path, DOCSTORE_FILE_NAME), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
+
+def batch_search(vector_store, queries: List[str], k: int):
+    """Search many queries with one embedding call and one index search"""
+    embeddings = vector_store.embedding_function
+    embed_queries = getattr(embeddings, 'embed_queries', embeddings.embed_documents)
+    xq = np.asarray(embed_queries(queries), dtype=np.float32)
+
+    # FAISS tiles all queries over the database vectors in a single pass
+    scores, indices = vector_store.index.search(xq, k)
+
+    results = []
+    for query_scores, query_indices in zip(scores.tolist(), indices.tolist()):
+        results.append([
+            (vector_store.docstore.search(vector_store.index_to_docstore_id[i]), score)
+            for i, score in zip(query_indices, query_scores)
+            if i != -1
+        ])
+    return results
@@ -1,37 +1,55 @@
 import os
-import json
-import random
-import pickle
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from datetime import datetime
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from typing import List
 import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import orjson
+import pandas as pd
 
 # LangChain imports
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.schema import Document
 
-# Load environment variables
-load_dotenv()
-os.environ["DEEPSEEK_API_KEY"] = os.getenv("DEEPSEEK_API_KEY")
+from .config import get_config
+from .documents import build_documents
+from .embeddings import get_embeddings, prune_embeddings_cache
+from .llm_cache import SemanticAnswerCache, configure_llm_cache
+from .state import RagState
+from .vector_index import (
+    INDEX_FILE_NAME,
+    batch_search,
+    build_vector_store,
+    load_vector_store_local,
+    save_vector_store_local
+)
+
+# Number of distinct queries whose answers are memoized
+QUERY_CACHE_SIZE = 512
+
+# Limits for bulk retrieval requests
+MAX_BATCH_QUERIES = 100
+MAX_BATCH_K = 50
 
 # Constants for file paths
+DATA_FILE_PATH = 'rag/ecommerce_data.json'
 VECTOR_STORE_PATH = 'rag/vector_store'
-EMBEDDINGS_CACHE_PATH = 'rag/embeddings_cache.pkl'
 DATA_HASH_PATH = 'rag/data_hash.txt'
 
 def get_data_hash():
     """Generate a hash of the data file to detect changes"""
     try:
-        if os.path.exists('rag/ecommerce_data.json'):
-            with open('rag/ecommerce_data.json', 'rb') as f:
+        if os.path.exists(DATA_FILE_PATH):
+            with open(DATA_FILE_PATH, 'rb') as f:
                 content = f.read()
                 return hashlib.md5(content).hexdigest()
     except:
@@ -58,50 +76,48 @@ def load_data_hash():
 
 def data_has_changed():
     """Check if the data has changed since last vector store creation"""
+    # An index written after the data file was last modified is up to date
+    index_path = os.path.join(VECTOR_STORE_PATH, INDEX_FILE_NAME)
+    if os.path.exists(index_path) and os.path.exists(DATA_FILE_PATH):
+        if os.path.getmtime(index_path) >= os.path.getmtime(DATA_FILE_PATH):
+            return False
+    
     current_hash = get_data_hash()
     saved_hash = load_data_hash()
     return current_hash != saved_hash
 
-def save_vector_store(vector_store, embeddings):
-    """Save vector store and embeddings to disk"""
+def save_vector_store(vector_store):
+    """Save vector store to disk"""
     try:
         # Create directory if it doesn't exist
         os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
         
         # Save vector store
-        vector_store.save_local(VECTOR_STORE_PATH)
-        
-        # Save embeddings cache
-        with open(EMBEDDINGS_CACHE_PATH, 'wb') as f:
-            pickle.dump(embeddings, f)
+        save_vector_store_local(vector_store, VECTOR_STORE_PATH)
         
         # Save data hash
         save_data_hash(get_data_hash())
         
-        print("Vector store and embeddings saved successfully")
+        print("Vector store saved successfully")
         return True
     except Exception as e:
         print(f"Error saving vector store: {e}")
         return False
 
 def load_vector_store():
-    """Load vector store and embeddings from disk"""
+    """Load vector store from disk using the shared embeddings model"""
     try:
-        if not os.path.exists(VECTOR_STORE_PATH) or not os.path.exists(EMBEDDINGS_CACHE_PATH):
-            return None, None
-        
-        # Load embeddings
-        with open(EMBEDDINGS_CACHE_PATH, 'rb') as f:
-            embeddings = pickle.load(f)
+        if not os.path.exists(VECTOR_STORE_PATH):
+            return None
         
-        # Load vector store
-        vector_store = FAISS.load_local(VECTOR_STORE_PATH, embeddings)
+        # Load vector store, mapping the index from disk
+        vector_store = load_vector_store_local(VECTOR_STORE_PATH, get_embeddings())
         
-        print("Vector store and embeddings loaded successfully from disk")
-        return vector_store, embeddings
+        print("Vector store loaded successfully from disk")
+        return vector_store
     except Exception as e:
         print(f"Error loading vector store: {e}")
-        return None, None
+        return None
 
 def generate_sample_ecommerce_data():
     """Generate 1000 sample ecommerce products and save to JSON"""
@@ -151,193 +167,239 @@ def generate_sample_ecommerce_data():
         ]
     }
     
-    products = []
-    reviews_data = []
+    tag_choices = ["bestseller", "eco-friendly", "premium", "budget", "new-arrival", "sale"]
+    review_texts = [
+        "Great product! Highly recommended.",
+        "Good value for money. Works as expected.",
+        "Excellent quality and fast shipping.",
+        "Not bad, but could be better.",
+        "Amazing product! Exceeded my expectations.",
+        "Decent product for the price.",
+        "Love it! Will buy again.",
+        "Good build quality and design.",
+        "Fair product, nothing special.",
+        "Outstanding! Worth every penny."
+    ]
+    statuses = ["pending", "processing", "shipped", "delivered", "cancelled"]
     
-    for i in range(1, 1001):
-        category = random.choice(categories)
-        brand = random.choice(brands)
-        product_name = random.choice(product_templates.get(category, ["Generic Product"]))
-        
-        # Generate product
-        product = {
-            "id": i,
-            "name": f"{brand} {product_name}",
-            "description": f"High-quality {product_name.lower()} from {brand}. Perfect for everyday use with excellent performance and durability.",
-            "category": category,
-            "brand": brand,
-            "price": round(random.uniform(9.99, 999.99), 2),
-            "rating": round(random.uniform(3.0, 5.0), 1),
-            "stock_quantity": random.randint(0, 500),
-            "is_active": random.choice([True, True, True, False]),  # 75% active
-            "created_at": (datetime.now() - timedelta(days=random.randint(1, 365))).isoformat(),
-            "tags": random.sample(["bestseller", "eco-friendly", "premium", "budget", "new-arrival", "sale"], k=random.randint(1, 3))
+    rng = np.random.default_rng()
+    now = np.datetime64(datetime.now(), 'us')
+    
+    def days_ago(low, high, size):
+        """Draw timestamps between low and high days in the past"""
+        days = rng.integers(low, high + 1, size).astype('timedelta64[D]')
+        return (now - days).tolist()
+    
+    # Draw all product attributes as arrays in one shot
+    num_products = 1000
+    category_idx = rng.integers(0, len(categories), num_products)
+    brand_idx = rng.integers(0, len(brands), num_products)
+    category_templates = [product_templates.get(category, ["Generic Product"]) for category in categories]
+    template_counts = np.array([len(templates) for templates in category_templates])
+    template_idx = (rng.random(num_products) * template_counts[category_idx]).astype(int)
+    prices = np.round(rng.uniform(9.99, 999.99, num_products), 2)
+    ratings = np.round(rng.uniform(3.0, 5.0, num_products), 1)
+    stock = rng.integers(0, 501, num_products)
+    is_active = rng.random(num_products) < 0.75  # 75% active
+    product_dates = days_ago(1, 365, num_products)
+    tag_counts = rng.integers(1, 4, num_products)
+    tag_order = rng.permuted(np.tile(np.arange(len(tag_choices)), (num_products, 1)), axis=1)
+    
+    # Generate 1-5 reviews per product
+    review_counts = rng.integers(1, 6, num_products)
+    num_reviews = int(review_counts.sum())
+    review_product_idx = np.repeat(np.arange(num_products), review_counts)
+    review_ratings = rng.integers(1, 6, num_reviews)
+    review_text_idx = rng.integers(0, len(review_texts), num_reviews)
+    reviewer_ids = rng.integers(1000, 10000, num_reviews)
+    review_dates = days_ago(1, 180, num_reviews)
+    verified = rng.random(num_reviews) < 0.5
+    
+    # Generate sample orders with 1-5 items each
+    num_orders = 200
+    item_counts = rng.integers(1, 6, num_orders)
+    num_items = int(item_counts.sum())
+    item_order_idx = np.repeat(np.arange(num_orders), item_counts)
+    item_product_idx = rng.integers(0, num_products, num_items)
+    quantities = rng.integers(1, 4, num_items)
+    item_prices = prices[item_product_idx]
+    item_totals = np.round(quantities * item_prices, 2)
+    order_totals = np.round(np.bincount(item_order_idx, weights=item_totals, minlength=num_orders), 2)
+    user_ids = rng.integers(1, 101, num_orders)
+    status_idx = rng.integers(0, len(statuses), num_orders)
+    order_dates = days_ago(1, 30, num_orders)
+    
+    # Single Python pass to assemble JSON records from the arrays
+    product_names = [
+        f"{brands[b]} {category_templates[c][t]}"
+        for b, c, t in zip(brand_idx.tolist(), category_idx.tolist(), template_idx.tolist())
+    ]
+    products = [
+        {
+            "id": i + 1,
+            "name": product_names[i],
+            "description": f"High-quality {category_templates[c][t].lower()} from {brands[b]}. Perfect for everyday use with excellent performance and durability.",
+            "category": categories[c],
+            "brand": brands[b],
+            "price": price,
+            "rating": rating,
+            "stock_quantity": quantity,
+            "is_active": active,
+            "created_at": created_at,
+            "tags": [tag_choices[j] for j in order[:k]]
         }
-        products.append(product)
-        
-        # Generate 1-5 reviews per product
-        for review_id in range(1, random.randint(2, 6)):
-            review = {
-                "id": len(reviews_data) + 1,
-                "product_id": i,
-                "product_name": product["name"],
-                "rating": random.randint(1, 5),
-                "review_text": random.choice([
-                    "Great product! Highly recommended.",
-                    "Good value for money. Works as expected.",
-                    "Excellent quality and fast shipping.",
-                    "Not bad, but could be better.",
-                    "Amazing product! Exceeded my expectations.",
-                    "Decent product for the price.",
-                    "Love it! Will buy again.",
-                    "Good build quality and design.",
-                    "Fair product, nothing special.",
-                    "Outstanding! Worth every penny."
-                ]),
-                "reviewer_name": f"Customer{random.randint(1000, 9999)}",
-                "created_at": (datetime.now() - timedelta(days=random.randint(1, 180))).isoformat(),
-                "verified_purchase": random.choice([True, False])
-            }
-            reviews_data.append(review)
-    
-    # Generate sample orders
-    orders_data = []
-    for order_id in range(1, 201):  # 200 orders
-        num_items = random.randint(1, 5)
-        order_items = []
-        total_amount = 0
-        
-        for item_num in range(num_items):
-            product = random.choice(products)
-            quantity = random.randint(1, 3)
-            item_price = product["price"]
-            
-            order_item = {
-                "product_id": product["id"],
-                "product_name": product["name"],
-                "quantity": quantity,
-                "price": item_price,
-                "total": round(quantity * item_price, 2)
-            }
-            order_items.append(order_item)
-            total_amount += order_item["total"]
-        
-        order = {
-            "id": order_id,
-            "user_id": random.randint(1, 100),
-            "items": order_items,
-            "total_amount": round(total_amount, 2),
-            "status": random.choice(["pending", "processing", "shipped", "delivered", "cancelled"]),
-            "created_at": (datetime.now() - timedelta(days=random.randint(1, 30))).isoformat()
+        for i, (c, b, t, price, rating, quantity, active, created_at, k, order) in enumerate(zip(
+            category_idx.tolist(), brand_idx.tolist(), template_idx.tolist(),
+            prices.tolist(), ratings.tolist(), stock.tolist(), is_active.tolist(),
+            product_dates, tag_counts.tolist(), tag_order.tolist()
+        ))
+    ]
+    
+    reviews_data = [
+        {
+            "id": i + 1,
+            "product_id": p + 1,
+            "product_name": product_names[p],
+            "rating": rating,
+            "review_text": review_texts[t],
+            "reviewer_name": f"Customer{reviewer}",
+            "created_at": created_at,
+            "verified_purchase": is_verified
+        }
+        for i, (p, rating, t, reviewer, created_at, is_verified) in enumerate(zip(
+            review_product_idx.tolist(), review_ratings.tolist(), review_text_idx.tolist(),
+            reviewer_ids.tolist(), review_dates, verified.tolist()
+        ))
+    ]
+    
+    orders_data = [
+        {
+            "id": i + 1,
+            "user_id": user_id,
+            "items": [],
+            "total_amount": total,
+            "status": statuses[status],
+            "created_at": created_at
         }
-        orders_data.append(order)
+        for i, (user_id, total, status, created_at) in enumerate(zip(
+            user_ids.tolist(), order_totals.tolist(), status_idx.tolist(), order_dates
+        ))
+    ]
+    for o, p, quantity, price, total in zip(
+        item_order_idx.tolist(), item_product_idx.tolist(), quantities.tolist(),
+        item_prices.tolist(), item_totals.tolist()
+    ):
+        orders_data[o]["items"].append({
+            "product_id": p + 1,
+            "product_name": product_names[p],
+            "quantity": quantity,
+            "price": price,
+            "total": total
+        })
     
     # Create the complete dataset
     ecommerce_data = {
         "products": products,
         "reviews": reviews_data,
         "orders": orders_data,
-        "generated_at": datetime.now().isoformat(),
+        "generated_at": datetime.now(),
         "total_products": len(products),
         "total_reviews": len(reviews_data),
         "total_orders": len(orders_data)
     }
     
-    # Save to JSON file
-    with open('rag/ecommerce_data.json', 'w') as f:
-        json.dump(ecommerce_data, f, indent=2)
+    # Save to JSON file; orjson serializes datetimes and NumPy values natively
+    with open(DATA_FILE_PATH, 'wb') as f:
+        f.write(orjson.dumps(ecommerce_data, option=orjson.OPT_SERIALIZE_NUMPY))
     
     print(f"Generated {len(products)} products, {len(reviews_data)} reviews, and {len(orders_data)} orders")
     return ecommerce_data
 
+@lru_cache(maxsize=1)
+def _parse_ecommerce_data(path, mtime_ns):
+    """Parse the JSON data file; the mtime argument keys the cache"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def read_ecommerce_data():
+    """Read the JSON data file, reusing the last parse until the file changes"""
+    return _parse_ecommerce_data(DATA_FILE_PATH, os.stat(DATA_FILE_PATH).st_mtime_ns)
+
 def load_ecommerce_data_from_json():
     """Load ecommerce data from JSON file and convert to documents"""
     try:
         # Check if file exists, if not generate it
-        if not os.path.exists('rag/ecommerce_data.json'):
+        if not os.path.exists(DATA_FILE_PATH):
             print("Generating sample ecommerce data...")
             generate_sample_ecommerce_data()
         
         # Load the JSON data
-        with open('rag/ecommerce_data.json', 'r') as f:
-            data = json.load(f)
+        data = read_ecommerce_data()
         
         all_documents = []
         
         # Process products
-        for product in data['products']:
-            content = f"""
-            Product: {product['name']}
-            Category: {product['category']}
-            Brand: {product['brand']}
-            Price: ${product['price']}
-            Rating: {product['rating']}/5.0
-            Description: {product['description']}
-            Stock: {product['stock_quantity']} units available
-            Status: {'Active' if product['is_active'] else 'Inactive'}
-            Tags: {', '.join(product['tags'])}
-            Added: {product['created_at'][:10]}
-            """
-            
-            doc = Document(
-                page_content=content.strip(),
-                metadata={
-                    'source': 'products',
-                    'id': product['id'],
-                    'category': product['category'],
-                    'brand': product['brand'],
-                    'price': product['price'],
-                    'rating': product['rating']
-                }
-            )
-            all_documents.append(doc)
+        products = pd.DataFrame(data['products'])
+        product_contents = (
+            "Product: " + products['name']
+            + "\nCategory: " + products['category']
+            + "\nBrand: " + products['brand']
+            + "\nPrice: $" + products['price'].astype(str)
+            + "\nRating: " + products['rating'].astype(str) + "/5.0"
+            + "\nDescription: " + products['description']
+            + "\nStock: " + products['stock_quantity'].astype(str) + " units available"
+            + "\nStatus: " + products['is_active'].map({True: 'Active', False: 'Inactive'})
+            + "\nTags: " + products['tags'].str.join(', ')
+            + "\nAdded: " + products['created_at'].str[:10]
+        )
+        all_documents.extend(build_documents(
+            'products',
+            product_contents,
+            products[['id', 'category', 'brand', 'price', 'rating']]
+        ))
         
         # Process reviews
-        for review in data['reviews']:
-            content = f"""
-            Product Review: {review['product_name']}
-            Rating: {review['rating']}/5 stars
-            Review: {review['review_text']}
-            Reviewer: {review['reviewer_name']}
-            Verified Purchase: {'Yes' if review['verified_purchase'] else 'No'}
-            Date: {review['created_at'][:10]}
-            """
-            
-            doc = Document(
-                page_content=content.strip(),
-                metadata={
-                    'source': 'reviews',
-                    'product_id': review['product_id'],
-                    'rating': review['rating'],
-                    'verified': review['verified_purchase']
-                }
+        reviews = pd.DataFrame(data['reviews'])
+        review_contents = (
+            "Product Review: " + reviews['product_name']
+            + "\nRating: " + reviews['rating'].astype(str) + "/5 stars"
+            + "\nReview: " + reviews['review_text']
+            + "\nReviewer: " + reviews['reviewer_name']
+            + "\nVerified Purchase: " + reviews['verified_purchase'].map({True: 'Yes', False: 'No'})
+            + "\nDate: " + reviews['created_at'].str[:10]
+        )
+        all_documents.extend(build_documents(
+            'reviews',
+            review_contents,
+            reviews[['product_id', 'rating', 'verified_purchase']].rename(
+                columns={'verified_purchase': 'verified'}
             )
-            all_documents.append(doc)
+        ))
         
-        # Process recent orders (last 30 days)
-        for order in data['orders']:
-            for item in order['items']:
-                content = f"""
-                Recent Order Information:
-                Product: {item['product_name']}
-                Quantity Ordered: {item['quantity']}
-                Price: ${item['price']} each
-                Order Total: ${item['total']}
-                Order Status: {order['status']}
-                Order Date: {order['created_at'][:10]}
-                Customer ID: {order['user_id']}
-                """
-                
-                doc = Document(
-                    page_content=content.strip(),
-                    metadata={
-                        'source': 'orders',
-                        'order_id': order['id'],
-                        'product_id': item['product_id'],
-                        'status': order['status']
-                    }
-                )
-                all_documents.append(doc)
+        # Process recent orders (last 30 days), one row per order item
+        items = pd.json_normalize(
+            data['orders'],
+            record_path='items',
+            meta=['id', 'user_id', 'status', 'created_at'],
+            meta_prefix='order_'
+        )
+        item_contents = (
+            "Recent Order Information:"
+            + "\nProduct: " + items['product_name']
+            + "\nQuantity Ordered: " + items['quantity'].astype(str)
+            + "\nPrice: $" + items['price'].astype(str) + " each"
+            + "\nOrder Total: $" + items['total'].astype(str)
+            + "\nOrder Status: " + items['order_status']
+            + "\nOrder Date: " + items['order_created_at'].str[:10]
+            + "\nCustomer ID: " + items['order_user_id'].astype(str)
+        )
+        all_documents.extend(build_documents(
+            'orders',
+            item_contents,
+            items[['order_id', 'product_id', 'order_status']].rename(
+                columns={'order_status': 'status'}
+            )
+        ))
         
         print(f"Loaded {len(all_documents)} documents from JSON data")
         return all_documents
@@ -347,13 +409,13 @@ def load_ecommerce_data_from_json():
         return []
 
 def setup_rag_chain():
-    """Set up RAG system with persistent storage"""
+    """Set up RAG system with persistent storage, returning the chain and its vector store"""
     try:
-        # Check if we can load existing vector store
-        vector_store, embeddings = load_vector_store()
+        # Load the existing vector store unless the data has changed
+        vector_store = None if data_has_changed() else load_vector_store()
         
-        # If no existing store or data has changed, create new one
-        if vector_store is None or data_has_changed():
+        # If no usable store on disk, create new one
+        if vector_store is None:
             print("Creating new vector store...")
             
             # Load documents from JSON
@@ -361,21 +423,24 @@ def setup_rag_chain():
             
             if not docs:
                 print("No documents loaded from JSON file")
-                return None
+                return None, None
             
             print(f"Setting up RAG with {len(docs)} documents")
             
-            # Create embeddings and vector store
-            embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-            vector_store = FAISS.from_documents(docs, embeddings)
+            # Create vector store with the shared embeddings model
+            vector_store = build_vector_store(docs, get_embeddings())
             
             # Save for future use
-            save_vector_store(vector_store, embeddings)
+            save_vector_store(vector_store)
+            
+            # Vectors of documents from older data are never read again
+            prune_embeddings_cache(len(docs))
         else:
             print("Using existing vector store from disk")
         
-        # Set up the DeepSeek model
-        llm = ChatDeepSeek(model="deepseek-chat", temperature=0.1)
+        # Set up the DeepSeek model behind the shared LLM cache
+        configure_llm_cache()
+        llm = ChatDeepSeek(model="deepseek-chat", temperature=0.1, api_key=get_config().deepseek_api_key)
         
         # Enhanced prompt template for ecommerce
         prompt_template = ChatPromptTemplate.from_messages([
@@ -404,82 +469,177 @@ def setup_rag_chain():
         )
         retrieval_chain = create_retrieval_chain(retriever, document_chain)
         
-        return retrieval_chain
+        return retrieval_chain, vector_store
         
     except Exception as e:
         print(f"Error setting up RAG chain: {e}")
-        return None
+        return None, None
 
-# Global variable to store the RAG chain
-rag_chain = None
-_initialization_lock = False
+# Shared RAG chain and vector store, swapped atomically on refresh
+rag_state = RagState()
+_warmup_thread = None
 
 def initialize_rag():
     """Initialize RAG chain with lazy loading"""
-    global rag_chain, _initialization_lock
+    return rag_state.initialize(setup_rag_chain)
+
+def start_rag_warmup():
+    """Initialize RAG chain on a background thread at startup"""
+    global _warmup_thread
     
-    if _initialization_lock:
-        return rag_chain is not None
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=initialize_rag, name='rag-warmup', daemon=True)
+        _warmup_thread.start()
+
+# Answers memoized by chain generation and exact query text, least recently used first
+_answer_cache = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+def get_cached_answer(query, generation):
+    """Return the memoized answer for a query against one chain generation, if any"""
+    key = (generation, query)
+    with _answer_cache_lock:
+        answer = _answer_cache.get(key)
+        if answer is not None:
+            _answer_cache.move_to_end(key)
+        return answer
+
+def cache_answer(query, answer, generation):
+    """Memoize an answer, evicting the least recently used beyond the cache size"""
+    key = (generation, query)
+    with _answer_cache_lock:
+        _answer_cache[key] = answer
+        _answer_cache.move_to_end(key)
+        if len(_answer_cache) > QUERY_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+# Answers of near-duplicate queries, matched by the embedding of the raw query text
+_semantic_answer_cache = SemanticAnswerCache()
+
+def clear_answer_cache():
+    """Drop all memoized answers"""
+    with _answer_cache_lock:
+        _answer_cache.clear()
+    _semantic_answer_cache.clear()
+
+async def find_cached_answer(query, generation):
+    """Look up an answer by exact query text, then by query embedding; also return the embedding"""
+    answer = get_cached_answer(query, generation)
+    if answer is not None:
+        return answer, None
     
-    if rag_chain is None:
-        _initialization_lock = True
-        try:
-            rag_chain = setup_rag_chain()
-        finally:
-            _initialization_lock = False
+    # Embed only the question, not the rendered prompt, so retrieved context can't mask it
+    query_vector = await get_embeddings().aembed_query(query)
+    answer = _semantic_answer_cache.lookup(query_vector, generation)
+    if answer is not None:
+        cache_answer(query, answer, generation)
+    return answer, query_vector
+
+def remember_answer(query, query_vector, answer, generation):
+    """Memoize a fresh answer by exact query text and by query embedding"""
+    # An empty answer would otherwise be served for this query forever
+    if not answer:
+        return
+    # Answers from a chain replaced mid-call are keyed by its old generation and never served
+    if generation != rag_state.generation:
+        return
+    cache_answer(query, answer, generation)
+    _semantic_answer_cache.update(query_vector, answer, generation)
+
+async def answer_query(query):
+    """Answer a query through the RAG chain, reusing answers to identical or near-duplicate queries"""
+    # Answer and cache against one chain even if a refresh swaps it meanwhile
+    chain, _, generation = rag_state.snapshot()
+    answer, query_vector = await find_cached_answer(query, generation)
+    if answer is None:
+        result = await chain.ainvoke({"input": query})
+        answer = result['answer']
+        remember_answer(query, query_vector, answer, generation)
+    return answer
+
+async def stream_answer(query):
+    """Yield answer tokens as the LLM produces them"""
+    chain, _, generation = rag_state.snapshot()
+    answer, query_vector = await find_cached_answer(query, generation)
+    if answer is not None:
+        yield answer
+        return
     
-    return rag_chain is not None
+    tokens = []
+    try:
+        async for chunk in chain.astream({"input": query}):
+            if 'answer' in chunk:
+                tokens.append(chunk['answer'])
+                yield chunk['answer']
+    except Exception as e:
+        # Headers are already sent, so report the failure in the stream itself
+        print(f"Error streaming answer: {e}")
+        yield f"\n\nAn error occurred while processing your query: {e}"
+        return
+    
+    # Only complete answers are memoized
+    remember_answer(query, query_vector, ''.join(tokens), generation)
+
+def batch_query(queries, k=5):
+    """Retrieve the top-k documents for many queries in one batched search"""
+    return batch_search(rag_state.vector_store, queries, k)
+
+def rebuild_rag_chain():
+    """Regenerate data and build a fresh RAG chain from it"""
+    # Generate new data
+    generate_sample_ecommerce_data()
+    
+    # Clear existing vector store
+    if os.path.exists(VECTOR_STORE_PATH):
+        import shutil
+        shutil.rmtree(VECTOR_STORE_PATH)
+    if os.path.exists(DATA_HASH_PATH):
+        os.remove(DATA_HASH_PATH)
+    
+    return setup_rag_chain()
 
 def refresh_rag_data():
     """Regenerate data and refresh RAG system"""
-    global rag_chain
     try:
-        # Generate new data
-        generate_sample_ecommerce_data()
-        
-        # Clear existing vector store
-        if os.path.exists(VECTOR_STORE_PATH):
-            import shutil
-            shutil.rmtree(VECTOR_STORE_PATH)
-        if os.path.exists(EMBEDDINGS_CACHE_PATH):
-            os.remove(EMBEDDINGS_CACHE_PATH)
-        if os.path.exists(DATA_HASH_PATH):
-            os.remove(DATA_HASH_PATH)
+        # Requests keep using the current chain until the new one is swapped in
+        if not rag_state.refresh(rebuild_rag_chain):
+            return False
         
-        # Reinitialize RAG chain
-        rag_chain = setup_rag_chain()
-        return rag_chain is not None
+        # Drop answers built from the old data
+        clear_answer_cache()
+        return True
     except Exception as e:
         print(f"Error refreshing data: {e}")
         return False
 
-def rag_view(request):
+async def rag_view(request):
     """Main view for RAG application with lazy initialization"""
-    global rag_chain
-    
     response = None
     error = None
+    warming_up = False
     
-    # Initialize RAG chain if not already done (lazy loading)
-    if rag_chain is None:
-        if not initialize_rag():
+    # Don't block on the startup warm-up; otherwise initialize lazily
+    if rag_state.chain is None:
+        if _warmup_thread is not None and not rag_state.ready.is_set():
+            warming_up = True
+            error = "⏳ The assistant is still warming up. Please try again in a few seconds."
+        elif not await sync_to_async(initialize_rag, thread_sensitive=False)():
             error = "Failed to initialize the RAG system. Please check the logs."
     
-    if request.method == 'POST':
+    if request.method == 'POST' and not warming_up:
         action = request.POST.get('action', 'query')
         
         if action == 'refresh':
-            if refresh_rag_data():
+            if await sync_to_async(refresh_rag_data, thread_sensitive=False)():
                 response = "✅ Successfully generated new sample data and refreshed the system!"
             else:
                 error = "❌ Failed to refresh data. Please check the logs."
         
         elif action == 'query':
             query = request.POST.get('query', '').strip()
-            if query and rag_chain:
+            if query and rag_state.chain:
                 try:
-                    result = rag_chain.invoke({"input": query})
-                    response = result['answer']
+                    response = await answer_query(query)
                 except Exception as e:
                     error = f"An error occurred while processing your query: {e}"
             else:
@@ -488,16 +648,15 @@ def rag_view(request):
     # Get some stats to display
     stats = {}
     try:
-        if os.path.exists('rag/ecommerce_data.json'):
-            with open('rag/ecommerce_data.json', 'r') as f:
-                data = json.load(f)
-                stats = {
-                    'total_products': data.get('total_products', 0),
-                    'total_reviews': data.get('total_reviews', 0),
-                    'total_orders': data.get('total_orders', 0),
-                    'generated_at': data.get('generated_at', 'Unknown')[:19].replace('T', ' '),
-                    'vector_store_status': '✅ Loaded from disk' if os.path.exists(VECTOR_STORE_PATH) else '🔄 Created in memory'
-                }
+        if os.path.exists(DATA_FILE_PATH):
+            data = read_ecommerce_data()
+            stats = {
+                'total_products': data.get('total_products', 0),
+                'total_reviews': data.get('total_reviews', 0),
+                'total_orders': data.get('total_orders', 0),
+                'generated_at': data.get('generated_at', 'Unknown')[:19].replace('T', ' '),
+                'vector_store_status': '✅ Loaded from disk' if os.path.exists(VECTOR_STORE_PATH) else '🔄 Created in memory'
+            }
     except:
         pass
 
@@ -507,3 +666,65 @@ def rag_view(request):
         'stats': stats
     })
 
+@csrf_exempt
+@require_POST
+async def rag_stream_view(request):
+    """Stream the answer to a query token by token, for API clients"""
+    query = request.POST.get('query', '').strip()
+    if not query:
+        return HttpResponse("Please enter a valid query.", status=400)
+    
+    if rag_state.chain is None:
+        if _warmup_thread is not None and not rag_state.ready.is_set():
+            return HttpResponse("The assistant is still warming up.", status=503)
+        if not await sync_to_async(initialize_rag, thread_sensitive=False)():
+            return HttpResponse("Failed to initialize the RAG system.", status=503)
+    
+    return StreamingHttpResponse(stream_answer(query), content_type='text/plain; charset=utf-8')
+
+@csrf_exempt
+@require_POST
+async def batch_query_view(request):
+    """Retrieve matching documents for a JSON list of queries, e.g. for bulk recommendations"""
+    try:
+        payload = orjson.loads(request.body)
+        queries = payload['queries']
+        k = int(payload.get('k', 5))
+    except (orjson.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'error': 'Expected a JSON body like {"queries": [...], "k": 5}.'}, status=400)
+    
+    # A bare string would otherwise be searched character by character
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return JsonResponse({'error': 'Expected "queries" to be a list of strings.'}, status=400)
+    queries = [query.strip() for query in queries if query.strip()]
+    
+    if not queries or len(queries) > MAX_BATCH_QUERIES or not 1 <= k <= MAX_BATCH_K:
+        return JsonResponse(
+            {'error': f"Send 1-{MAX_BATCH_QUERIES} queries with k between 1 and {MAX_BATCH_K}."},
+            status=400
+        )
+    
+    if rag_state.vector_store is None:
+        if _warmup_thread is not None and not rag_state.ready.is_set():
+            return JsonResponse({'error': 'The assistant is still warming up.'}, status=503)
+        if not await sync_to_async(initialize_rag, thread_sensitive=False)():
+            return JsonResponse({'error': 'Failed to initialize the RAG system.'}, status=503)
+    
+    try:
+        # Encoding and searching are CPU-bound, so keep them off the event loop
+        results = await sync_to_async(batch_query, thread_sensitive=False)(queries, k)
+    except Exception as e:
+        return JsonResponse({'error': f"An error occurred while searching: {e}"}, status=500)
+    
+    return JsonResponse({
+        'results': [
+            {
+                'query': query,
+                'documents': [
+                    {'content': doc.page_content, 'metadata': doc.metadata, 'score': score}
+                    for doc, score in matches
+                ]
+            }
+            for query, matches in zip(queries, results)
+        ]
+    })